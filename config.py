@@ -4,31 +4,36 @@
 """
 
 import os
+import re
+from dataclasses import dataclass
 from pathlib import Path
 
+# .env 行格式: KEY=VALUE（值可带单/双引号，# 开头为注释）
+_ENV_LINE_RE = re.compile(
+    r"""^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|(.*?))[ \t\r]*$""",
+    re.MULTILINE
+)
+
+
+# 项目根目录（只解析一次，供 .env 与各数据目录共用）
+BASE_DIR = Path(__file__).resolve().parent
+
+
 # 加载 .env 文件
 def load_env_file():
-    """加载 .env 文件到环境变量"""
-    env_file = Path(__file__).parent / ".env"
-    if env_file.exists():
-        with open(env_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    # 移除引号
-                    if value.startswith('"') and value.endswith('"'):
-                        value = value[1:-1]
-                    elif value.startswith("'") and value.endswith("'"):
-                        value = value[1:-1]
-                    os.environ[key] = value
+    """加载 .env 文件到环境变量（已存在的环境变量优先，不会被覆盖）"""
+    env_file = BASE_DIR / ".env"
+    if not env_file.exists():
+        return
+    text = env_file.read_text(encoding='utf-8')
+    for m in _ENV_LINE_RE.finditer(text):
+        key = m.group(1)
+        if key not in os.environ:
+            os.environ[key] = next(v for v in m.group(2, 3, 4) if v is not None)
 
 load_env_file()
 
 # ==================== 基础配置 ====================
-BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = BASE_DIR / "logdata"
 SERVICE_LOG_DIR = BASE_DIR / "log"
 RECORDING_DIR = LOG_DIR / "recordings"  # 录屏文件目录
@@ -44,16 +49,38 @@ LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s | %(message)s"
 # ==================== EyeLink 配置 ====================
 # 注意：这些配置涉及 EyeLink 1000 Plus 眼动仪硬件
 # 如果不确定，请保持默认值或咨询 SR Research 技术支持
-EYELINK_HOST_IP = os.getenv("EYELINK_HOST_IP", "100.1.1.1")  # 眼动仪主机 IP（默认值）
-EYELINK_DUMMY_MODE = os.getenv("EYELINK_DUMMY_MODE", "false").lower() == "true"
-EYELINK_SCREEN_WIDTH = int(os.getenv("EYELINK_SCREEN_WIDTH", "1920"))
-EYELINK_SCREEN_HEIGHT = int(os.getenv("EYELINK_SCREEN_HEIGHT", "1080"))
 
-# 启动时自动连接 EyeLink
-EYELINK_AUTO_CONNECT = os.getenv("EYELINK_AUTO_CONNECT", "true").lower() == "true"
 
-# Overlay 使用的眼睛（"left" 或 "right"，默认 "right"）
-EYELINK_OVERLAY_EYE = os.getenv("EYELINK_OVERLAY_EYE", "right").lower()
+@dataclass(frozen=True, slots=True)
+class EyeLinkConfig:
+    """EyeLink 配置快照（只读，启动时从环境变量读取一次）"""
+    EYELINK_HOST_IP: str
+    EYELINK_DUMMY_MODE: bool
+    EYELINK_SCREEN_WIDTH: int
+    EYELINK_SCREEN_HEIGHT: int
+    EYELINK_AUTO_CONNECT: bool
+    EYELINK_OVERLAY_EYE: str
+
+
+CONFIG = EyeLinkConfig(
+    # 眼动仪主机 IP（默认值）
+    EYELINK_HOST_IP=os.getenv("EYELINK_HOST_IP", "100.1.1.1"),
+    EYELINK_DUMMY_MODE=os.getenv("EYELINK_DUMMY_MODE", "false").lower() == "true",
+    EYELINK_SCREEN_WIDTH=int(os.getenv("EYELINK_SCREEN_WIDTH", "1920")),
+    EYELINK_SCREEN_HEIGHT=int(os.getenv("EYELINK_SCREEN_HEIGHT", "1080")),
+    # 启动时自动连接 EyeLink
+    EYELINK_AUTO_CONNECT=os.getenv("EYELINK_AUTO_CONNECT", "true").lower() == "true",
+    # Overlay 使用的眼睛（"left" 或 "right"，默认 "right"）
+    EYELINK_OVERLAY_EYE=os.getenv("EYELINK_OVERLAY_EYE", "right").lower(),
+)
+
+# 模块级别名，保持向后兼容
+EYELINK_HOST_IP = CONFIG.EYELINK_HOST_IP
+EYELINK_DUMMY_MODE = CONFIG.EYELINK_DUMMY_MODE
+EYELINK_SCREEN_WIDTH = CONFIG.EYELINK_SCREEN_WIDTH
+EYELINK_SCREEN_HEIGHT = CONFIG.EYELINK_SCREEN_HEIGHT
+EYELINK_AUTO_CONNECT = CONFIG.EYELINK_AUTO_CONNECT
+EYELINK_OVERLAY_EYE = CONFIG.EYELINK_OVERLAY_EYE
 
 # ==================== 初始化目录 ====================
 def init_directories():
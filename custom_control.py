@@ -4,29 +4,264 @@
 提供简单的实验流程控制
 """
 
+import asyncio
+import importlib.util
 import logging
+import sys
 import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from queue import SimpleQueue
+from typing import Callable, Dict, Optional
 
-from eyelink_manager import eyelink_manager, EYELINK_AVAILABLE
+from eyelink_manager import eyelink_manager, close_graphics, is_eyelink_available
 import config
 
 logger = logging.getLogger(__name__)
 
-# 检查 pygame 是否可用
-try:
-    import pygame
-    PYGAME_AVAILABLE = True
-except ImportError:
-    PYGAME_AVAILABLE = False
+# 检查 pygame 是否已安装（不在导入时加载 SDL）
+PYGAME_AVAILABLE = importlib.util.find_spec("pygame") is not None
+if not PYGAME_AVAILABLE:
     logger.warning("pygame 不可用，图形界面功能将被禁用")
 
 
 # ==================== 实验流程控制 ====================
 
-def start_experiment_control():
+# 启动横幅与命令帮助（导入时拼接一次）
+_SEPARATOR = "=" * 50
+_BANNER = "\n".join([
+    "",
+    _SEPARATOR,
+    "EyeLink 实验控制",
+    _SEPARATOR,
+    "校准:   c=校准 v=验证 d=漂移校正",
+    "录制:   start=开始录制 (EDF + 屏幕)",
+    "        end=结束录制 (保存 + Overlay)",
+    "其他:   marker <text>=发送标记",
+    "        connect=重新连接 status=状态",
+    "        help=帮助 quit=退出",
+    _SEPARATOR,
+    "",
+    "",
+])
+
+# EyeLink / pygame 调用均为阻塞操作，统一放到单独的工作线程执行，
+# 保证图形界面始终运行在同一线程，且 tracker 操作按顺序进行。
+# 使用守护线程：退出时不等待仍在进行的连接或校准界面返回
+_eyelink_jobs: SimpleQueue = SimpleQueue()
+
+
+def _eyelink_worker() -> None:
+    """EyeLink 工作线程：依次执行队列中的阻塞调用"""
+    while True:
+        future, func, args = _eyelink_jobs.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+
+threading.Thread(target=_eyelink_worker, name="eyelink", daemon=True).start()
+
+
+def _submit_blocking(func, *args) -> Future:
+    """提交阻塞调用到 EyeLink 工作线程"""
+    future: Future = Future()
+    _eyelink_jobs.put((future, func, args))
+    return future
+
+# 控制循环所在的事件循环（start_experiment_control 时记录）
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _run_blocking(func, *args):
+    """在 EyeLink 工作线程中执行阻塞调用"""
+    return await asyncio.wrap_future(_submit_blocking(func, *args))
+
+
+def _stdin_reader(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> None:
     """
-    实验控制主函数
-    
+    读取标准输入并投递到命令队列
+
+    使用独立的守护线程而不是 asyncio.to_thread：阻塞中的 readline
+    无法取消，若占用事件循环的默认线程池会拖住服务关闭。
+    """
+    while True:
+        line = sys.stdin.readline()
+        try:
+            # 空字符串表示 EOF，同样投递给控制循环
+            loop.call_soon_threadsafe(queue.put_nowait, line)
+        except RuntimeError:
+            # 事件循环已关闭
+            return
+        if not line:
+            return
+
+
+async def _read_command(queue: asyncio.Queue, prompt: str = "> ") -> str:
+    """输出提示符并等待下一条输入，EOF 时抛出 EOFError"""
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = await queue.get()
+    if not line:
+        raise EOFError
+    return line.strip()
+
+
+# 连接参数与 EDF 保存目录（配置在启动后不变，导入时计算一次）
+_CONNECT_ARGS = (
+    config.CONFIG.EYELINK_HOST_IP,
+    config.CONFIG.EYELINK_DUMMY_MODE,
+    config.CONFIG.EYELINK_SCREEN_WIDTH,
+    config.CONFIG.EYELINK_SCREEN_HEIGHT,
+)
+_SAVE_DIR_STR = str(config.LOG_DIR / "eyelink_data")
+
+
+@dataclass
+class ControlState:
+    """控制循环状态"""
+    queue: asyncio.Queue
+    experiment_running: bool = False
+    should_exit: bool = False
+
+
+# ---------- 命令处理函数 ----------
+# 签名统一为 (state, arg)，arg 为命令后的参数文本（可能为空）
+
+async def _cmd_connect(state: ControlState, arg: str) -> bool:
+    """按配置连接 EyeLink（已连接时先断开旧连接）"""
+    if state.experiment_running or eyelink_manager.recording:
+        print("实验运行中，请先 end 结束记录再重新连接\n")
+        return False
+
+    success = await _run_blocking(eyelink_manager.connect, *_CONNECT_ARGS)
+    if success:
+        print("✓ 已连接\n")
+    else:
+        print("✗ 连接失败\n")
+    return success
+
+
+async def _cmd_help(state: ControlState, arg: str) -> None:
+    """显示命令帮助"""
+    sys.stdout.write(_BANNER)
+    sys.stdout.flush()
+
+
+async def _cmd_setup(state: ControlState, arg: str) -> None:
+    """打开 EyeLink 设置界面（校准/验证/漂移校正）"""
+    await _run_blocking(eyelink_manager.open_setup)
+
+
+async def _cmd_start(state: ControlState, arg: str) -> None:
+    """开始记录（EDF + 屏幕）"""
+    if state.experiment_running:
+        print("实验已在运行")
+        return
+
+    # 启动 EyeLink 记录和屏幕录制
+    success, timestamp = await _run_blocking(eyelink_manager.start_recording, True)
+    if success:
+        state.experiment_running = True
+        print(f"✓ EyeLink + 屏幕录制已开始 ({timestamp})")
+
+
+async def _cmd_end(state: ControlState, arg: str) -> None:
+    """结束记录（停止录制 + 保存，CSV / Overlay 在后台生成）"""
+    if not state.experiment_running:
+        print("实验未运行")
+        return
+
+    print("停止录制并处理数据...")
+
+    # 保存到本地（自动停止屏幕录制，CSV / Overlay 提交到后台）
+    previous_future = eyelink_manager.postprocess_future
+    success = await _run_blocking(eyelink_manager.stop_recording, True, _SAVE_DIR_STR)
+
+    if success:
+        state.experiment_running = False
+        print(f"✓ 记录已停止\n✓ 文件保存在: {_SAVE_DIR_STR}")
+        # 只有本次停止提交了后处理任务（EDF 传输成功）时才提示
+        if eyelink_manager.postprocess_future is not previous_future:
+            print("  CSV / Overlay 正在后台生成")
+    else:
+        print("✗ 停止记录失败")
+
+
+async def _cmd_marker(state: ControlState, arg: str) -> None:
+    """发送标记"""
+    if not arg:
+        print("用法: marker <消息>")
+        return
+
+    if await _run_blocking(eyelink_manager.send_message, arg):
+        print(f"✓ 标记已发送: {arg}")
+    else:
+        print("发送失败")
+
+
+async def _cmd_status(state: ControlState, arg: str) -> None:
+    """查看状态"""
+    status = eyelink_manager.get_status()
+    lines = [
+        f"连接: {status.connected}",
+        f"录制中: {status.recording}",
+    ]
+    if status.recording:
+        lines.append(f"会话ID: {eyelink_manager.session_timestamp}")
+    print("\n".join(lines))
+
+
+async def _cmd_quit(state: ControlState, arg: str) -> None:
+    """退出控制循环"""
+    if state.experiment_running:
+        confirm = await _read_command(state.queue, "录制运行中，确认退出? (y/n): ")
+        if confirm.lower() != 'y':
+            return
+
+    print("退出")
+    state.should_exit = True
+
+
+# 命令分发表
+_COMMANDS = {
+    "c": _cmd_setup,
+    "v": _cmd_setup,
+    "d": _cmd_setup,
+    "start": _cmd_start,
+    "end": _cmd_end,
+    "marker": _cmd_marker,
+    "status": _cmd_status,
+    "connect": _cmd_connect,
+    "help": _cmd_help,
+    "quit": _cmd_quit,
+}
+
+
+async def _pygame_missing(state: ControlState, arg: str) -> None:
+    print("错误: pygame 未安装")
+
+
+async def _pylink_missing(state: ControlState, arg: str) -> bool:
+    print("错误: PyLink 不可用")
+    return False
+
+
+# pygame 可用性在导入时即确定，直接替换对应命令，避免每次执行时检查
+if not PYGAME_AVAILABLE:
+    _COMMANDS["c"] = _COMMANDS["v"] = _COMMANDS["d"] = _pygame_missing
+
+# 需要 PyLink 的命令；PyLink 可能在首次加载时才发现不可用，执行时再检查
+_PYLINK_COMMANDS = frozenset({"connect", "start", "end"})
+
+
+async def _control_loop(queue: asyncio.Queue) -> None:
+    """
+    实验控制主循环
+
     命令：
     - c: 校准
     - v: 验证
@@ -34,140 +269,112 @@ def start_experiment_control():
     - start: 开始记录
     - end: 结束记录并保存
     - marker <text>: 发送标记
+    - connect: 重新连接
     - status: 查看状态
+    - help: 显示帮助
     - quit: 退出
     """
-    
-    def control_loop():
-        experiment_running = False
-        
-        print("\n" + "=" * 50)
-        print("EyeLink 实验控制")
-        print("=" * 50)
-        print("校准:   c=校准 v=验证 d=漂移校正")
-        print("录制:   start=开始录制 (EDF + 屏幕)")
-        print("        end=结束录制 (保存 + Overlay)")
-        print("其他:   marker <text>=发送标记")
-        print("        status=状态 quit=退出")
-        print("=" * 50 + "\n")
-        
-        # 自动连接
-        if config.EYELINK_AUTO_CONNECT and EYELINK_AVAILABLE:
-            logger.info("自动连接 EyeLink...")
-            success = eyelink_manager.connect(
-                host_ip=config.EYELINK_HOST_IP,
-                dummy_mode=config.EYELINK_DUMMY_MODE,
-                screen_width=config.EYELINK_SCREEN_WIDTH,
-                screen_height=config.EYELINK_SCREEN_HEIGHT
-            )
-            if success:
-                print("✓ 已连接\n")
-            else:
-                print("✗ 连接失败\n")
-        
-        while True:
+    state = ControlState(queue=queue)
+
+    await _cmd_help(state, "")
+
+    # 自动连接
+    if config.CONFIG.EYELINK_AUTO_CONNECT and is_eyelink_available():
+        logger.info("自动连接 EyeLink...")
+        await _cmd_connect(state, "")
+
+    try:
+        while not state.should_exit:
             try:
-                cmd = input("> ").strip()
+                cmd = await _read_command(queue)
                 if not cmd:
                     continue
-                
+
                 parts = cmd.split(maxsplit=1)
                 action = parts[0].lower()
-                
-                # 打开 EyeLink 设置界面（校准/验证/漂移校正）
-                if action in {"c", "v", "d"}:
-                    if not PYGAME_AVAILABLE:
-                        print("错误: pygame 未安装")
-                        continue
-                    eyelink_manager.open_setup()
-                
-                # 开始记录（EDF + 屏幕）
-                elif action == "start":
-                    if experiment_running:
-                        print("实验已在运行")
-                        continue
-                    
-                    # 启动 EyeLink 记录和屏幕录制
-                    success, timestamp = eyelink_manager.start_recording(enable_screen_recording=True)
-                    if success:
-                        experiment_running = True
-                        print(f"✓ EyeLink + 屏幕录制已开始 ({timestamp})")
-                
-                # 结束记录（停止录制 + 保存 + Overlay）
-                elif action == "end":
-                    if not experiment_running:
-                        print("实验未运行")
-                        continue
-                    
-                    print("停止录制并处理数据...")
-                    
-                    # 保存到本地（自动停止屏幕录制并 overlay）
-                    save_dir = config.LOG_DIR / "eyelink_data"
-                    success = eyelink_manager.stop_recording(
-                        save_local=True,
-                        local_dir=str(save_dir)
-                    )
-                    
-                    if success:
-                        experiment_running = False
-                        print(f"✓ 记录已停止")
-                        print(f"✓ 文件保存在: {save_dir}")
-                    else:
-                        print("✗ 停止记录失败")
-                
-                # 发送标记
-                elif action == "marker":
-                    if len(parts) < 2:
-                        print("用法: marker <消息>")
-                        continue
-                    
-                    message = parts[1]
-                    if eyelink_manager.send_message(message):
-                        print(f"✓ 标记已发送: {message}")
-                    else:
-                        print("发送失败")
-                
-                # 状态
-                elif action == "status":
-                    status = eyelink_manager.get_status()
-                    print(f"连接: {status.connected}")
-                    print(f"录制中: {status.recording}")
-                    if status.recording:
-                        print(f"会话ID: {eyelink_manager.current_timestamp}")
-                
-                # 退出
-                elif action == "quit":
-                    if experiment_running:
-                        confirm = input("录制运行中，确认退出? (y/n): ")
-                        if confirm.lower() != 'y':
-                            continue
-                    
-                    print("退出")
-                    break
-                
-                else:
+                handler = _COMMANDS.get(action)
+                if handler is None:
                     print(f"未知命令: {action}")
-            
-            except (EOFError, KeyboardInterrupt):
+                    continue
+                if action in _PYLINK_COMMANDS and not is_eyelink_available():
+                    handler = _pylink_missing
+
+                await handler(state, parts[1] if len(parts) > 1 else "")
+
+            except EOFError:
                 print("\n中断")
                 break
             except Exception as e:
                 logger.error(f"错误: {e}")
-        
-        # 清理图形界面
-        try:
-            if EYELINK_AVAILABLE:
-                import pylink
-                pylink.closeGraphics()
-            if PYGAME_AVAILABLE:
-                pygame.quit()
-            logger.info("图形界面已关闭")
-        except Exception as e:
-            logger.error(f"关闭图形界面时出错: {e}")
-    
-    # 后台线程运行
-    thread = threading.Thread(target=control_loop, daemon=True)
-    thread.start()
+    finally:
+        # 清理图形界面（工作线程仍被连接/校准阻塞时最多等待 2 秒）
+        await asyncio.wait([asyncio.wrap_future(_submit_blocking(_close_graphics))], timeout=2)
+
+
+def _close_graphics() -> None:
+    """关闭 pylink / pygame 图形界面"""
+    try:
+        close_graphics()
+        # 仅当 pygame 已被加载时才需要退出
+        pygame = sys.modules.get("pygame")
+        if pygame is not None:
+            pygame.quit()
+        logger.info("图形界面已关闭")
+    except Exception as e:
+        logger.error(f"关闭图形界面时出错: {e}")
+
+
+def start_experiment_control() -> asyncio.Task:
+    """
+    启动实验控制
+
+    控制循环作为协程运行在服务的事件循环中，返回的 Task
+    可在服务关闭时取消。必须在事件循环内调用。
+    """
+    global _loop
+    loop = _loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    reader = threading.Thread(
+        target=_stdin_reader, args=(loop, queue), name="stdin-reader", daemon=True
+    )
+    reader.start()
+
+    return loop.create_task(_control_loop(queue))
+
+
+def submit_to_control_loop(coro) -> Future:
+    """
+    将协程提交到控制循环所在的事件循环执行，立即返回
+
+    可在任意线程调用；返回 concurrent.futures.Future，调用方无需等待。
+    """
+    if _loop is None:
+        coro.close()
+        raise RuntimeError("实验控制尚未启动")
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+# MAIC 控制事件处理表：event_name -> handler(data) -> bool
+_EVENT_HANDLERS: Dict[str, Callable[[dict], bool]] = {}
+
+
+def register_control_handler(event_name: str, handler: Callable[[dict], bool]) -> None:
+    """
+    注册 MAIC 控制事件处理函数
+
+    handler 接收事件的 data，返回 True 表示已处理（不再发送标准标记）。
+    handler 在 MAIC 数据接收路径上同步调用，不能阻塞：
+    耗时的 tracker 操作请通过 submit_to_control_loop 提交。
+
+    示例：
+        def _on_start(data):
+            submit_to_control_loop(_run_blocking(eyelink_manager.start_recording, True))
+            return True
+
+        register_control_handler("START_RECORDING", _on_start)
+    """
+    _EVENT_HANDLERS[event_name] = handler
 
 
 def handle_control_message(event_name: str, data: dict) -> bool:
@@ -176,16 +383,13 @@ def handle_control_message(event_name: str, data: dict) -> bool:
     
     返回 True 表示已处理，不再发送标准标记
     """
-    # 这里可以添加特殊事件处理
-    # 例如：
-    # if event_name == "START_RECORDING":
-    #     eyelink_manager.start_recording()
-    #     return True
-    
-    return False
+    handler = _EVENT_HANDLERS.get(event_name)
+    if handler is None:
+        return False
+    return handler(data)
 
 
-def initialize_custom_control():
-    """初始化自定义控制"""
+def initialize_custom_control() -> asyncio.Task:
+    """初始化自定义控制，返回控制循环的 Task"""
     logger.info("初始化实验控制")
-    start_experiment_control()
+    return start_experiment_control()
@@ -10,22 +10,68 @@ EyeLink 眼动仪管理模块
 某些实现细节可能需要根据实际硬件配置调整
 """
 
+import importlib.util
 import logging
 import threading
-from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
 
 from models import EyeLinkMarker, EyeLinkStatus, EyeLinkStatusResponse, MarkerType
 
-# 尝试导入 PyLink
-try:
-    import pylink
-    EYELINK_AVAILABLE = True
-except ImportError:
-    EYELINK_AVAILABLE = False
-    pylink = None
+# PyLink 在首次使用时才导入（导入会加载 SDK 动态库），这里只检查是否已安装
+EYELINK_AVAILABLE = importlib.util.find_spec("pylink") is not None
+pylink = None
+_pylink_lock = threading.Lock()
 
 logger = logging.getLogger(__name__)
 
+# pyarrow 可选：安装后 samples 保存为 Parquet
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# 停止记录后的 CSV 导出 / Overlay 在后台单线程中依次执行
+_postprocess_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="eyelink-post")
+
+# Data Viewer 试验变量消息格式
+_TRIAL_VAR_FMT = "!V TRIAL_VAR %s %s"
+
+
+def _load_pylink():
+    """
+    首次使用时导入 PyLink 并缓存模块
+    
+    已安装但 SDK 动态库加载失败时，将 EYELINK_AVAILABLE 置为 False 并返回 None。
+    """
+    global pylink, EYELINK_AVAILABLE
+    if pylink is None and EYELINK_AVAILABLE:
+        with _pylink_lock:
+            if pylink is None and EYELINK_AVAILABLE:
+                try:
+                    import pylink as _pylink
+                except (ImportError, OSError) as e:
+                    EYELINK_AVAILABLE = False
+                    logger.error("PyLink 加载失败，EyeLink 功能已禁用: %s", e)
+                    return None
+                pylink = _pylink
+    return pylink
+
+
+def load_pylink() -> bool:
+    """加载 PyLink 并返回是否可用（服务启动时调用，尽早暴露 SDK 问题）"""
+    return _load_pylink() is not None
+
+
+def is_eyelink_available() -> bool:
+    """PyLink 当前是否可用（加载失败后返回 False）"""
+    return EYELINK_AVAILABLE
+
+
+def close_graphics() -> None:
+    """关闭 PyLink 图形界面（PyLink 尚未加载时无需处理）"""
+    if pylink is not None:
+        pylink.closeGraphics()
+
 
 class EyeLinkManager:
     """
@@ -34,6 +80,30 @@ class EyeLinkManager:
     线程安全的单例模式，管理眼动仪的生命周期
     """
     
+    # 视为已连接的状态
+    _CONNECTED_STATES = frozenset({EyeLinkStatus.CONNECTED, EyeLinkStatus.RECORDING})
+    
+    # 标记类型 -> EDF 消息文本
+    _MARKER_FORMATTERS = {
+        MarkerType.MESSAGE: lambda m: m.message,
+        # TRIALID 是 Data Viewer 识别试验开始的特殊标记
+        MarkerType.TRIAL_START: lambda m: f"TRIALID {m.trial_id or 'unknown'}",
+        # TRIAL_RESULT 标记试验结束，0 表示成功
+        MarkerType.TRIAL_END: lambda m: "TRIAL_RESULT 0",
+        MarkerType.STIMULUS_ON: lambda m: f"STIMULUS_ON {m.message}",
+        MarkerType.STIMULUS_OFF: lambda m: f"STIMULUS_OFF {m.message}",
+        MarkerType.RESPONSE: lambda m: f"RESPONSE {m.message}",
+        MarkerType.CUSTOM: lambda m: m.message,
+    }
+    
+    # 数据过滤配置（固定不变，连接时发送一次）
+    _RECORD_COMMANDS = (
+        "file_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,MESSAGE,BUTTON,INPUT",
+        "file_sample_data = LEFT,RIGHT,GAZE,HREF,RAW,AREA,HTARGET,GAZERES,BUTTON,STATUS,INPUT",
+        "link_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,BUTTON,FIXUPDATE,INPUT",
+        "link_sample_data = LEFT,RIGHT,GAZE,GAZERES,AREA,HTARGET,STATUS,INPUT",
+    )
+    
     def __init__(self):
         self.tracker: Optional[object] = None  # PyLink tracker 对象
         self.status: EyeLinkStatus = EyeLinkStatus.DISCONNECTED
@@ -41,10 +111,12 @@ class EyeLinkManager:
         self.edf_file: Optional[str] = None
         self.session_timestamp: Optional[str] = None  # 会话时间戳
         self.current_video_label: Optional[str] = None  # 当前屏幕录制标签
+        self.postprocess_future: Optional[Future] = None  # 最近一次记录的后处理任务
         self.error_message: Optional[str] = None
         self.screen_width: int = 1920  # 屏幕宽度
         self.screen_height: int = 1080  # 屏幕高度
         self._lock = threading.RLock()  # 使用可重入锁，允许同一线程多次获取
+        self._status_snapshot: EyeLinkStatusResponse = self._build_status()  # get_status 返回的快照
         
     def connect(
         self,
@@ -71,40 +143,62 @@ class EyeLinkManager:
         """
         logger.info("连接 EyeLink...")
         
-        # 检查 PyLink 可用性
-        if not EYELINK_AVAILABLE:
+        # 检查 PyLink 可用性（首次连接时加载）
+        if _load_pylink() is None:
             self.error_message = "PyLink library not available. Install EyeLink Developers Kit."
             self.status = EyeLinkStatus.ERROR
+            self._update_status_snapshot()
             logger.error("PyLink 不可用，请安装 EyeLink Developers Kit")
             return False
         
+        # 重新连接：先关闭旧连接（正在记录时会先停止记录），避免旧 tracker 被覆盖而未关闭
+        if self.tracker is not None:
+            logger.info("关闭现有连接")
+            self.disconnect()
+        
         try:
             with self._lock:
                 self.status = EyeLinkStatus.CONNECTING
+                self._update_status_snapshot()
                 
                 # 创建连接
                 if dummy_mode:
                     logger.info("使用虚拟模式")
                     self.tracker = pylink.EyeLink(None)
                 else:
-                    logger.info(f"连接到设备: {host_ip}")
+                    logger.info("连接到设备: %s", host_ip)
                     self.tracker = pylink.EyeLink(host_ip)
                 
                 
+                # 配置记录参数（设置在连接期间保持有效，无需每次开始记录时重复发送）
+                send_command = self.tracker.sendCommand
+                for cmd in self._RECORD_COMMANDS:
+                    send_command(cmd)
+                
                 # 保存屏幕尺寸供后续使用
                 self.screen_width = screen_width
                 self.screen_height = screen_height
                                 
                 self.status = EyeLinkStatus.CONNECTED
                 self.error_message = None
+                self._update_status_snapshot()
                 logger.info("EyeLink 连接成功")
                 self.current_video_label = None
                 return True
                 
         except Exception as e:
             self.error_message = f"Connection failed: {str(e)}"
-            self.status = EyeLinkStatus.ERROR
-            logger.error(f"连接失败: {self.error_message}")
+            with self._lock:
+                # 连接已建立但后续配置失败时关闭连接，避免残留打开的 tracker
+                if self.tracker is not None:
+                    try:
+                        self.tracker.close()
+                    except Exception as close_error:
+                        logger.debug("关闭 tracker 失败: %s", close_error)
+                    self.tracker = None
+                self.status = EyeLinkStatus.ERROR
+                self._update_status_snapshot()
+            logger.error("连接失败: %s", self.error_message)
             return False
     
     def disconnect(self) -> None:
@@ -113,10 +207,18 @@ class EyeLinkManager:
         
         自动停止记录并关闭连接
         """
+        if self.tracker is None and self.status == EyeLinkStatus.DISCONNECTED:
+            return
+        
         try:
+            # 先在锁外停止记录：stop_recording 的 CSV/录屏后处理耗时较长，
+            # 在这里持锁调用会让后处理期间一直占用 tracker 锁
+            if self.recording:
+                self.stop_recording()
+            
             with self._lock:
                 if self.tracker:
-                    if self.recording:
+                    if self.recording:  # 期间又开始了记录
                         self.stop_recording()
                     self.tracker.close()
                     self.tracker = None
@@ -124,9 +226,10 @@ class EyeLinkManager:
                 self.status = EyeLinkStatus.DISCONNECTED
                 self.recording = False
                 self.edf_file = None  # 清空 EDF 文件名
+                self._update_status_snapshot()
                 
         except Exception as e:
-            logger.error(f"Error during disconnect: {e}", exc_info=True)
+            logger.error("Error during disconnect: %s", e, exc_info=True)
     
     def start_recording(self, enable_screen_recording: bool = True) -> tuple:
         """
@@ -143,23 +246,20 @@ class EyeLinkManager:
             - 时间戳格式：YYYYMMDD_HHMMSS
             - 录屏和EDF使用相同的时间戳
         """
-        from datetime import datetime
-        
-        # 生成统一的会话时间戳
-        session_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 生成统一的会话时间戳（两个名称取自同一时刻，避免跨秒/跨分钟不一致）
+        now = datetime.now()
+        session_timestamp = now.strftime("%Y%m%d_%H%M%S")
         
         # EyeLink EDF文件名限制：最多8个字符（DOS 8.3格式）
         # 使用简短的时间戳：MMDDHHSS（月日时分秒）
-        edf_short_name = datetime.now().strftime("%m%d%H%M") + ".edf"
-        
-        logger.info(f"开始记录: {edf_short_name} (会话:{session_timestamp})")
+        edf_short_name = now.strftime("%m%d%H%M") + ".edf"
         
         if not self.tracker:
             logger.error("未连接")
             return (False, None)
             
         if self.status != EyeLinkStatus.CONNECTED:
-            logger.error(f"状态错误: {self.status.value}")
+            logger.error("状态错误: %s", self.status.value)
             return (False, None)
             
         try:
@@ -168,31 +268,21 @@ class EyeLinkManager:
                 self.tracker.openDataFile(edf_short_name)
                 self.edf_file = edf_short_name
                 self.session_timestamp = session_timestamp  # 保存会话时间戳
-                
-                # 配置记录参数
-                commands = [
-                    "file_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,MESSAGE,BUTTON,INPUT",
-                    "file_sample_data = LEFT,RIGHT,GAZE,HREF,RAW,AREA,HTARGET,GAZERES,BUTTON,STATUS,INPUT",
-                    "link_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,BUTTON,FIXUPDATE,INPUT",
-                    "link_sample_data = LEFT,RIGHT,GAZE,GAZERES,AREA,HTARGET,STATUS,INPUT"
-                ]
-                
-                for cmd in commands:
-                    self.tracker.sendCommand(cmd)
+                self._update_status_snapshot()
                 
                 # 开始记录
                 error = self.tracker.startRecording(1, 1, 1, 1)
                 if error:
-                    logger.error(f"startRecording 错误: {error}")
+                    logger.error("startRecording 错误: %s", error)
                     return (False, None)
                 
                 # 等待数据流稳定（100ms）
-                import pylink
                 pylink.pumpDelay(100)
                 
                 self.recording = True
                 self.status = EyeLinkStatus.RECORDING
-                logger.info("EyeLink 记录已开始")
+                self._update_status_snapshot()
+                logger.info("EyeLink 记录已开始: %s (会话:%s)", edf_short_name, session_timestamp)
             
             # 启动屏幕录制（在锁外面执行，避免长时间持有锁）
             if enable_screen_recording:
@@ -206,12 +296,12 @@ class EyeLinkManager:
                     else:
                         logger.warning("屏幕录制启动失败: 未获取有效文件名")
                 except Exception as e:
-                    logger.warning(f"屏幕录制启动失败: {e}")
+                    logger.warning("屏幕录制启动失败: %s", e)
             
             return (True, session_timestamp)
                 
         except Exception as e:
-            logger.error(f"记录启动失败: {e}")
+            logger.error("记录启动失败: %s", e)
             return (False, None)
     
     def stop_recording(self, save_local: bool = False, local_dir: str = None) -> bool:
@@ -230,6 +320,10 @@ class EyeLinkManager:
             
         try:
             with self._lock:
+                # 等锁期间可能已被其他线程停止
+                if not self.tracker or not self.recording:
+                    return True
+                
                 logger.info("停止记录")
 
                 # 在停止录制前记录屏幕录制结束标记
@@ -241,8 +335,6 @@ class EyeLinkManager:
                 # 保存到本地
                 saved_edf_path = None
                 if save_local and local_dir and self.edf_file and self.session_timestamp:
-                    from pathlib import Path
-                    
                     save_path = Path(local_dir)
                     save_path.mkdir(parents=True, exist_ok=True)
                     
@@ -251,93 +343,106 @@ class EyeLinkManager:
                     
                     try:
                         self.tracker.receiveDataFile(self.edf_file, str(local_file))
-                        logger.debug(f"EDF 已保存: {local_file}")
+                        logger.debug("EDF 已保存: %s", local_file)
                         saved_edf_path = local_file  # 保存实际路径
                     except Exception as e:
-                        logger.error(f"EDF传输失败: {e}")
+                        logger.error("EDF传输失败: %s", e)
                 
                 self.tracker.closeDataFile()
                 self.recording = False
                 self.status = EyeLinkStatus.CONNECTED
+                self._update_status_snapshot()
+                session_timestamp = self.session_timestamp
                 logger.info("EyeLink 记录已停止")
                 
-                # 解析 EDF 为 CSV
-                if saved_edf_path:
-                    try:
-                        logger.debug("解析 EDF 为 CSV")
-                        from pyedfread import read_edf
-                        from pathlib import Path
-                        
-                        if saved_edf_path.exists():
-                            # 读取 EDF
-                            samples, events, messages = read_edf(str(saved_edf_path), ignore_samples=False)
-                            
-                            # 保存 CSV
-                            csv_base = saved_edf_path.parent / self.session_timestamp
-                            
-                            if samples is not None and not samples.empty:
-                                samples_csv = f"{csv_base}_samples.csv"
-                                samples.to_csv(samples_csv, index=False)
-                            
-                            if events is not None and not events.empty:
-                                events_csv = f"{csv_base}_events.csv"
-                                events.to_csv(events_csv, index=False)
-                            
-                            if messages is not None and not messages.empty:
-                                messages_csv = f"{csv_base}_messages.csv"
-                                messages.to_csv(messages_csv, index=False)
-                        else:
-                            logger.warning(f"EDF 文件未找到: {saved_edf_path}")
-                    
-                    except Exception as e:
-                        logger.error(f"CSV 导出失败: {e}")
-                        import traceback
-                        traceback.print_exc()
+        except Exception as e:
+            logger.error("停止记录失败: %s", e)
+            self.current_video_label = None
+            return False
+        
+        # 录屏立即停止；CSV 导出和 Overlay 耗时较长，提交到后台线程，调用方无需等待
+        video_path = self._stop_screen_recording()
+        if saved_edf_path:
+            self.postprocess_future = _postprocess_executor.submit(
+                self._postprocess, saved_edf_path, video_path, session_timestamp
+            )
+        elif video_path:
+            logger.debug("录屏已保存 (无 Overlay)")
+        return True
+    
+    def _stop_screen_recording(self) -> Optional[str]:
+        """停止屏幕录制，返回视频路径（未录屏时返回 None）"""
+        try:
+            from screen_recorder import screen_recorder
+            return screen_recorder.stop_recording()
+        except Exception as e:
+            logger.error("停止屏幕录制失败: %s", e, exc_info=True)
+            return None
+    
+    def _postprocess(self, edf_path: Path, video_path: Optional[str], session_timestamp: str) -> None:
+        """后台执行的记录后处理：EDF 转 CSV，有录屏时再叠加眼动轨迹"""
+        self._export_edf_csv(edf_path, session_timestamp)
+        if video_path:
+            self._overlay_screen_recording(video_path, edf_path, session_timestamp)
+    
+    def _export_edf_csv(self, edf_path: Path, session_timestamp: str) -> None:
+        """解析 EDF 并保存 samples（Parquet 或 CSV）/ events / messages（CSV）"""
+        try:
+            logger.debug("解析 EDF 为 CSV")
+            from pyedfread import read_edf
+            
+            if edf_path.exists():
+                # 读取 EDF
+                samples, events, messages = read_edf(str(edf_path), ignore_samples=False)
                 
-                # 停止屏幕录制并处理 overlay
-                try:
-                    from screen_recorder import screen_recorder, overlay_gaze_on_video
-                    
-                    # 停止录屏
-                    video_path = screen_recorder.stop_recording()
-                    
-                    # 如果有录屏且有 EDF 文件，进行 overlay 处理
-                    if video_path and saved_edf_path:
-                        
-                        from pathlib import Path
-                        
-                        # 使用实际保存的 EDF 文件路径
-                        if saved_edf_path.exists():
-                            # Overlay视频：使用时间戳_gaze.mp4
-                            overlay_output = str(Path(video_path).parent / f"{self.session_timestamp}_gaze.mp4")
-                            
-                            # 导入配置
-                            import config
-                            
-                            success = overlay_gaze_on_video(
-                                video_path=video_path,
-                                edf_path=str(saved_edf_path),
-                                output_path=overlay_output
-                            )
-                            
-                            if not success:
-                                logger.error("Overlay 处理失败")
-                        else:
-                            logger.warning(f"EDF 文件未找到: {saved_edf_path}")
-                    elif video_path:
-                        logger.debug("录屏已保存 (无 Overlay)")
+                # 保存 CSV
+                csv_base = edf_path.parent / session_timestamp
                 
-                except Exception as e:
-                    logger.error(f"录屏处理失败: {e}")
-                    import traceback
-                    traceback.print_exc()
+                # samples 行数最多（约 1000Hz），有 pyarrow 时写 Parquet，比 CSV 快且小得多
+                if samples is not None and not samples.empty:
+                    if PARQUET_AVAILABLE:
+                        samples.to_parquet(f"{csv_base}_samples.parquet", index=False, compression="zstd")
+                    else:
+                        samples_csv = f"{csv_base}_samples.csv"
+                        samples.to_csv(samples_csv, index=False)
                 
-                return True
+                if events is not None and not events.empty:
+                    events_csv = f"{csv_base}_events.csv"
+                    events.to_csv(events_csv, index=False)
                 
+                if messages is not None and not messages.empty:
+                    messages_csv = f"{csv_base}_messages.csv"
+                    messages.to_csv(messages_csv, index=False)
+            else:
+                logger.warning("EDF 文件未找到: %s", edf_path)
+        
         except Exception as e:
-            logger.error(f"停止记录失败: {e}")
-            self.current_video_label = None
-            return False
+            logger.error("CSV 导出失败: %s", e, exc_info=True)
+    
+    def _overlay_screen_recording(self, video_path: str, edf_path: Path, session_timestamp: str) -> None:
+        """将眼动数据叠加到录屏上"""
+        try:
+            from screen_recorder import overlay_gaze_on_video_isolated
+            
+            # 使用实际保存的 EDF 文件路径
+            if edf_path.exists():
+                # Overlay视频：使用时间戳_gaze.mp4
+                overlay_output = str(Path(video_path).parent / f"{session_timestamp}_gaze.mp4")
+                
+                # 在子进程中处理，避免逐帧处理占用服务进程的 GIL
+                success = overlay_gaze_on_video_isolated(
+                    video_path=video_path,
+                    edf_path=str(edf_path),
+                    output_path=overlay_output
+                )
+                
+                if not success:
+                    logger.error("Overlay 处理失败")
+            else:
+                logger.warning("EDF 文件未找到: %s", edf_path)
+        
+        except Exception as e:
+            logger.error("录屏处理失败: %s", e, exc_info=True)
     
     def send_marker(self, marker: EyeLinkMarker) -> bool:
         """
@@ -359,70 +464,101 @@ class EyeLinkManager:
             logger.warning("❌ 无法发送标记: Tracker 对象不存在")
             return False
             
-        if self.status not in [EyeLinkStatus.CONNECTED, EyeLinkStatus.RECORDING]:
-            logger.warning(f"❌ 无法发送标记: 状态不正确 ({self.status.value})")
+        if self.status not in self._CONNECTED_STATES:
+            logger.warning("❌ 无法发送标记: 状态不正确 (%s)", self.status.value)
             logger.warning("需要 CONNECTED 或 RECORDING 状态")
             return False
         
-        logger.debug("-" * 40)
-        logger.debug(f"发送标记: {marker.marker_type.value}")
-        logger.debug(f"  消息: {marker.message}")
-        if marker.trial_id:
-            logger.debug(f"  试验ID: {marker.trial_id}")
-        if marker.additional_data:
-            logger.debug(f"  附加数据: {marker.additional_data}")
+        # 每个标记都会经过这里，DEBUG 关闭时跳过格式化
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "发送标记: %s 消息: %s 试验ID: %s 附加数据: %s",
+                marker.marker_type.value, marker.message,
+                marker.trial_id, marker.additional_data,
+            )
             
+        # 在锁外生成全部消息，锁内只做发送
+        messages = self._marker_messages(marker)
+        
         try:
             with self._lock:
-                message_to_send = None
-                
-                # 根据标记类型发送不同格式的消息
-                if marker.marker_type == MarkerType.MESSAGE:
-                    message_to_send = marker.message
-                    
-                elif marker.marker_type == MarkerType.TRIAL_START:
-                    # TRIALID 是 Data Viewer 识别试验开始的特殊标记
-                    trial_id = marker.trial_id or "unknown"
-                    message_to_send = f"TRIALID {trial_id}"
-                    
-                elif marker.marker_type == MarkerType.TRIAL_END:
-                    # TRIAL_RESULT 标记试验结束，0 表示成功
-                    message_to_send = "TRIAL_RESULT 0"
-                    
-                elif marker.marker_type == MarkerType.STIMULUS_ON:
-                    message_to_send = f"STIMULUS_ON {marker.message}"
-                    
-                elif marker.marker_type == MarkerType.STIMULUS_OFF:
-                    message_to_send = f"STIMULUS_OFF {marker.message}"
-                    
-                elif marker.marker_type == MarkerType.RESPONSE:
-                    message_to_send = f"RESPONSE {marker.message}"
-                    
-                elif marker.marker_type == MarkerType.CUSTOM:
-                    message_to_send = marker.message
-                
-                # 发送消息
-                if message_to_send:
-                    self.tracker.sendMessage(message_to_send)
-                
-                # 发送附加变量
-                if marker.additional_data:
-                    for key, value in marker.additional_data.items():
-                        self.tracker.sendMessage(f"!V TRIAL_VAR {key} {value}")
-                
-                logger.debug(f"Marker: {message_to_send}")
-                return True
+                self._send_messages_locked(messages)
+            logger.debug("Marker: %s", messages)
+            return True
                 
         except Exception as e:
-            logger.error(f"发送标记失败: {e}")
+            logger.error("发送标记失败: %s", e)
             return False
     
+    def send_markers_bulk(self, markers: List[EyeLinkMarker]) -> int:
+        """
+        批量发送标记到眼动仪
+        
+        只检查一次状态、获取一次锁，然后依次发送所有标记。
+        
+        Args:
+            markers: 标记数据对象列表
+            
+        Returns:
+            成功发送的标记数量
+        """
+        if not markers:
+            return 0
+        
+        if not self.tracker or self.status not in self._CONNECTED_STATES:
+            logger.warning("❌ 无法发送 %d 个标记: 未连接", len(markers))
+            return 0
+        
+        batches = [self._marker_messages(marker) for marker in markers]
+        
+        sent = 0
+        errors = []  # 发送失败的异常，释放锁后再记录日志
+        with self._lock:
+            if not self.tracker:
+                return 0
+            for messages in batches:
+                try:
+                    self._send_messages_locked(messages)
+                    sent += 1
+                except Exception as e:
+                    errors.append(e)
+        
+        for e in errors:
+            logger.error("发送标记失败: %s", e)
+        logger.debug("批量发送标记: %d/%d", sent, len(markers))
+        return sent
+    
+    @classmethod
+    def _format_marker(cls, marker: EyeLinkMarker) -> Optional[str]:
+        """根据标记类型生成要写入 EDF 的消息文本"""
+        formatter = cls._MARKER_FORMATTERS.get(marker.marker_type)
+        return formatter(marker) if formatter else None
+    
+    @classmethod
+    def _marker_messages(cls, marker: EyeLinkMarker) -> List[str]:
+        """生成标记对应的全部 EDF 消息（标记文本 + 每个附加变量一条 TRIAL_VAR）"""
+        message = cls._format_marker(marker)
+        messages = [message] if message else []
+        
+        # EDF 消息为单行文本，每个变量一条
+        if marker.additional_data:
+            messages.extend([_TRIAL_VAR_FMT % item for item in marker.additional_data.items()])
+        
+        return messages
+    
+    def _send_messages_locked(self, messages: List[str]) -> None:
+        """依次发送预先生成的消息（调用方需持有 self._lock）"""
+        send_message = self.tracker.sendMessage
+        for message in messages:
+            send_message(message)
+    
     def open_setup(self) -> bool:
         """打开 EyeLink 图形界面，用户可手动执行校准/验证/漂移校正"""
         if not self.tracker:
             logger.error("未连接到 EyeLink")
             return False
 
+        graphics_open = False
         try:
             logger.info("打开 EyeLink 设置界面")
 
@@ -432,6 +568,7 @@ class EyeLinkManager:
             
             pylink.closeGraphics()
             pylink.openGraphics()
+            graphics_open = True
 
             # 设置统一的图形参数
             pylink.setCalibrationColors((0, 0, 0), (128, 128, 128))
@@ -443,18 +580,19 @@ class EyeLinkManager:
             self.tracker.doTrackerSetup()
 
             pylink.closeGraphics()
+            graphics_open = False
             logger.info("已关闭 EyeLink 设置界面")
             return True
 
         except Exception as e:
-            logger.error(f"打开设置界面失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("打开设置界面失败: %s", e, exc_info=True)
 
-            try:
-                pylink.closeGraphics()
-            except:
-                pass
+            # 仅在图形界面确实已打开时才关闭
+            if graphics_open:
+                try:
+                    pylink.closeGraphics()
+                except Exception as close_error:
+                    logger.error("关闭图形界面失败: %s", close_error)
 
             return False
     
@@ -479,13 +617,13 @@ class EyeLinkManager:
             return False
         
         # 检查状态
-        if self.status not in [EyeLinkStatus.CONNECTED, EyeLinkStatus.RECORDING]:
-            logger.warning(f"无法发送消息: 状态不正确 ({self.status.value})")
+        if self.status not in self._CONNECTED_STATES:
+            logger.warning("无法发送消息: 状态不正确 (%s)", self.status.value)
             return False
         
         # 检查消息长度
         if len(message) > 130:
-            logger.warning(f"消息过长 ({len(message)} 字符)，将被截断为 130 字符")
+            logger.warning("消息过长 (%d 字符)，将被截断为 130 字符", len(message))
         
         try:
             with self._lock:
@@ -493,30 +631,39 @@ class EyeLinkManager:
                 result = self.tracker.sendMessage(message)
                 
                 if result == 0:
-                    logger.debug(f"消息已发送: {message}")
+                    logger.debug("消息已发送: %s", message)
                 elif result == 1:
-                    logger.warning(f"消息已发送但被截断: {message[:130]}...")
+                    logger.warning("消息已发送但被截断: %s...", message[:130])
                 else:
-                    logger.error(f"消息发送失败，返回值: {result}")
+                    logger.error("消息发送失败，返回值: %s", result)
                     return False
                     
             return True
         except Exception as e:
-            logger.error(f"发送消息失败: {e}")
+            logger.error("发送消息失败: %s", e)
             return False
     
     def get_status(self) -> EyeLinkStatusResponse:
-        """获取当前状态"""
+        """
+        获取当前状态
+        
+        返回状态变化时生成的快照，高频轮询不会重复创建响应对象。
+        """
+        return self._status_snapshot
+
+    def _build_status(self) -> EyeLinkStatusResponse:
+        """根据当前字段生成状态响应"""
         return EyeLinkStatusResponse(
             status=self.status,
-            connected=self.tracker is not None and self.status in [
-                EyeLinkStatus.CONNECTED,
-                EyeLinkStatus.RECORDING
-            ],
+            connected=self.tracker is not None and self.status in self._CONNECTED_STATES,
             recording=self.recording,
             edf_file=self.edf_file,
             error_message=self.error_message
         )
+    
+    def _update_status_snapshot(self) -> None:
+        """状态字段变化后重新生成 get_status 快照"""
+        self._status_snapshot = self._build_status()
 
 
 # 全局单例实例
@@ -6,28 +6,46 @@ MAIC JSON Service - 主服务文件
 消息频率由 MAIC 服务器控制，通过 /ingest 端点接收
 """
 
+import asyncio
+import atexit
 import json
 import logging
+import logging.handlers
+import queue
 import uuid
+from concurrent.futures import wait
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Any, Dict
+from pathlib import Path
+from typing import Any, Dict, List
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi.responses import Response
 from pydantic import ValidationError
 
 import config
-from eyelink_manager import EYELINK_AVAILABLE, eyelink_manager
+from eyelink_manager import eyelink_manager, is_eyelink_available, load_pylink
 from models import AckResponse, EyeLinkMarker, IngressPayload, MarkerType
 from utils import generate_event_brief
-from custom_control import initialize_custom_control
+from custom_control import handle_control_message, initialize_custom_control
 
 # 初始化日志
+# 记录先放入内存队列，由后台线程写出，避免慢速输出阻塞持锁的 EyeLink 调用
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(logging.Formatter(config.LOG_FORMAT))
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _log_output, respect_handler_level=True
+)
+_log_enqueue = logging.handlers.QueueHandler(_log_queue)
+_log_enqueue.setFormatter(logging.Formatter("%(message)s"))  # 完整格式由 _log_output 负责
 logging.basicConfig(
     level=getattr(logging, config.LOG_LEVEL),
-    format=config.LOG_FORMAT
+    handlers=[_log_enqueue]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)  # 退出时写出队列中剩余的日志
 logger = logging.getLogger(__name__)
 
 # 初始化必要的目录
@@ -40,7 +58,7 @@ config.init_directories()
 # 你可以在这里编写代码来响应特定的输入或事件
 # 
 
-def custom_eyelink_control():
+def custom_eyelink_control() -> asyncio.Task:
     """
     自定义 EyeLink 控制函数
     
@@ -54,35 +72,59 @@ def custom_eyelink_control():
     4. 便捷的工具函数
     
     直接编辑 custom_control.py 来添加你的自定义逻辑。
+    
+    返回控制循环的 Task，服务关闭时将其取消。
     """
-    initialize_custom_control()
+    return initialize_custom_control()
 
 
 # ==================== 生命周期事件 ====================
 
+# 关闭服务时等待 CSV / Overlay 后处理的最长时间
+_POSTPROCESS_TIMEOUT = 600  # 秒
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info(f"Starting {config.APP_NAME} v{config.APP_VERSION}")
     
-    if not EYELINK_AVAILABLE:
+    # 启动时加载 PyLink，SDK 未安装或动态库损坏时尽早提示
+    if not await asyncio.to_thread(load_pylink):
         logger.warning("PyLink 不可用")
     
     # 启动自定义控制
-    custom_eyelink_control()
+    control_task = custom_eyelink_control()
+    
+    # 启动标记发送任务
+    marker_task = asyncio.create_task(_drain_markers())
     
     yield
     
     # 关闭
     logger.info("Shutting down")
+    control_task.cancel()
+    marker_task.cancel()
     
     # 清理
     try:
+        # 发送队列中剩余的标记
+        remaining = _take_pending_markers()
+        if remaining:
+            eyelink_manager.send_markers_bulk(remaining)
+        
         status = eyelink_manager.get_status()
         if status.recording:
             eyelink_manager.stop_recording()
         if status.connected:
             eyelink_manager.disconnect()
+        
+        # 等待后台的 CSV 导出 / Overlay 完成，避免会话数据未生成就退出
+        future = eyelink_manager.postprocess_future
+        if future is not None and not future.done():
+            logger.info("等待 CSV / Overlay 后处理完成...")
+            done, _ = await asyncio.to_thread(wait, [future], _POSTPROCESS_TIMEOUT)
+            if not done:
+                logger.warning("后处理未在 %s 秒内完成，将在退出时继续等待", _POSTPROCESS_TIMEOUT)
     except Exception as e:
         logger.error(f"清理错误: {e}")
 
@@ -95,20 +137,30 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 内容固定的响应体在导入时预先序列化
+# PyLink 可用性可能在首次加载失败后变化，两种结果各预先序列化一份
+_HEALTH_BODIES = {
+    available: orjson.dumps({
+        "status": "ok",
+        "service": config.APP_NAME,
+        "version": config.APP_VERSION,
+        "eyelink_available": available
+    })
+    for available in (True, False)
+}
+_NOT_OBJECT_BODY = orjson.dumps({"detail": "JSON must be an object (dict)"})
+_SERVER_ERROR_BODY = orjson.dumps({"ok": False, "error": "ServerError"})
+
 
 # ==================== 核心API ====================
 
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {
-        "status": "ok",
-        "service": config.APP_NAME,
-        "version": config.APP_VERSION,
-        "eyelink_available": EYELINK_AVAILABLE
-    }
+    return Response(content=_HEALTH_BODIES[is_eyelink_available()], media_type="application/json")
 
 
+# response_model 仅用于 OpenAPI 文档：处理函数直接返回序列化好的 Response
 @app.post("/ingest", response_model=AckResponse)
 async def ingest_data(request: Request, background_tasks: BackgroundTasks):
     """
@@ -124,22 +176,24 @@ async def ingest_data(request: Request, background_tasks: BackgroundTasks):
         # 解析 JSON
         raw_data = await request.json()
         if not isinstance(raw_data, dict):
-            raise HTTPException(
+            return Response(
+                content=_NOT_OBJECT_BODY,
                 status_code=400,
-                detail="JSON must be an object (dict)"
+                media_type="application/json"
             )
         
         # 验证数据
         try:
             parsed = IngressPayload(**raw_data)
         except ValidationError as ve:
-            return JSONResponse(
-                status_code=400,
-                content={
+            return Response(
+                content=orjson.dumps({
                     "ok": False,
                     "error": "ValidationError",
                     "detail": json.loads(ve.json())
-                }
+                }),
+                status_code=400,
+                media_type="application/json"
             )
 
         # 生成 request_id
@@ -150,25 +204,56 @@ async def ingest_data(request: Request, background_tasks: BackgroundTasks):
         # 后台处理
         background_tasks.add_task(process_data, payload_dict, request_id)
 
-        # 返回确认
-        return AckResponse(
-            ok=True,
-            request_id=request_id,
-            received_keys={k: True for k in raw_data.keys()}
+        # 返回确认（直接用 orjson 序列化，跳过 response_model 校验）
+        return Response(
+            content=orjson.dumps({
+                "ok": True,
+                "request_id": request_id,
+                "received_keys": dict.fromkeys(raw_data, True)
+            }),
+            media_type="application/json"
         )
 
-    except HTTPException:
-        raise
     except Exception as e:
         logger.exception(f"Error in ingest: {e}")
-        return JSONResponse(
+        return Response(
+            content=_SERVER_ERROR_BODY,
             status_code=500,
-            content={"ok": False, "error": "ServerError"}
+            media_type="application/json"
         )
 
 
 # ==================== 数据处理 ====================
 
+
+# 待发送的 EyeLink 标记，由 _drain_markers 批量发送
+# 有界队列：tracker 卡住时丢弃新标记，避免内存无限增长
+_MARKER_QUEUE_MAXSIZE = 10000
+_MARKER_DROP_LOG_EVERY = 100  # 每丢弃 N 个标记输出一次警告
+_marker_queue: "asyncio.Queue[EyeLinkMarker]" = asyncio.Queue(maxsize=_MARKER_QUEUE_MAXSIZE)
+_dropped_markers = 0
+
+
+def _take_pending_markers() -> List[EyeLinkMarker]:
+    """取出队列中当前所有待发送的标记"""
+    batch = []
+    while not _marker_queue.empty():
+        batch.append(_marker_queue.get_nowait())
+    return batch
+
+
+async def _drain_markers() -> None:
+    """后台任务：将连续到达的标记合并为一批，一次性发送"""
+    while True:
+        batch = [await _marker_queue.get()]
+        batch.extend(_take_pending_markers())
+        try:
+            # sendMessage 为阻塞的网络调用，放到线程中执行
+            await asyncio.to_thread(eyelink_manager.send_markers_bulk, batch)
+        except Exception as e:
+            logger.error(f"Marker error: {e}")
+
+
 async def process_data(payload: Dict[str, Any], request_id: str) -> None:
     """
     处理接收到的数据
@@ -195,11 +280,14 @@ async def process_data(payload: Dict[str, Any], request_id: str) -> None:
             "payload": payload
         }
         
-        # 写入文件
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        # 写入文件（放到线程中执行，避免阻塞事件循环）
+        await asyncio.to_thread(write_log_file, filepath, log_data)
+        
+        logger.info("Processed: %s -> %s", request_id, filepath)
         
-        logger.info(f"Processed: {request_id} -> {filepath}")
+        # 特殊控制消息（不阻塞，已处理则不再发送标准标记）
+        if handle_control_message(payload.get("event") or "", payload.get("data") or {}):
+            return
         
         # 发送标记到眼动仪
         await send_eyelink_marker(payload, request_id, now)
@@ -208,18 +296,26 @@ async def process_data(payload: Dict[str, Any], request_id: str) -> None:
         logger.exception(f"Error processing data: {e}")
 
 
+def write_log_file(filepath: Path, log_data: Dict[str, Any]) -> None:
+    """将日志数据写入文件（阻塞 I/O）"""
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(log_data, f, ensure_ascii=False, indent=2)
+
+
 async def send_eyelink_marker(
     payload: Dict[str, Any],
     request_id: str,
     timestamp: datetime
 ) -> None:
     """发送标记到 EyeLink（添加 MAIC 前缀标识）"""
+    global _dropped_markers
     if not eyelink_manager.get_status().connected:
         return
     
     try:
         # 添加 MAIC 前缀，便于识别来自 MAIC 平台的消息
-        marker = EyeLinkMarker(
+        # 字段均由服务端生成，使用 model_construct 跳过 pydantic 校验
+        marker = EyeLinkMarker.model_construct(
             marker_type=MarkerType.MESSAGE,
             message=f"MAIC_{request_id}",  # MAIC 前缀标识
             timestamp=timestamp,
@@ -227,8 +323,17 @@ async def send_eyelink_marker(
             additional_data=None
         )
         
-        eyelink_manager.send_marker(marker)
-        logger.debug(f"EyeLink 标记: MAIC_{request_id}")
+        try:
+            _marker_queue.put_nowait(marker)
+        except asyncio.QueueFull:
+            _dropped_markers += 1
+            if _dropped_markers % _MARKER_DROP_LOG_EVERY == 1:
+                logger.warning(
+                    "标记队列已满 (%d)，已丢弃 %d 个标记",
+                    _MARKER_QUEUE_MAXSIZE, _dropped_markers
+                )
+            return
+        logger.debug("EyeLink 标记入队: MAIC_%s", request_id)
             
     except Exception as e:
         logger.error(f"Marker error: {e}")
@@ -5,6 +5,9 @@
 """
 
 import logging
+import os
+import subprocess
+import sys
 import threading
 import time
 from pathlib import Path
@@ -45,6 +48,7 @@ class ScreenRecorder:
         self.thread = None
         self.writer = None
         self.output_file = None
+        self._stop_event = threading.Event()  # 停止信号，唤醒录制线程
         
     def start_recording(self, filename: str = None) -> Optional[str]:
         """
@@ -91,11 +95,12 @@ class ScreenRecorder:
             )
             
             # 开始录制线程
+            self._stop_event.clear()
             self.recording = True
             self.thread = threading.Thread(target=self._record_loop, daemon=True)
             self.thread.start()
             
-            logger.debug(f"屏幕录制开始: {self.output_file}")
+            logger.debug("屏幕录制开始: %s", self.output_file)
             return filename
             
         except Exception as e:
@@ -104,10 +109,16 @@ class ScreenRecorder:
     
     def _record_loop(self):
         """录制循环"""
+        frame_interval = 1.0 / self.fps
+        stop_event = self._stop_event
+        
         with mss() as sct:
             monitor = sct.monitors[1]  # 主显示器
             
-            while self.recording:
+            # 按固定截止时间调度，截屏/编码耗时不会累积成帧率漂移
+            deadline = time.monotonic()
+            while not stop_event.is_set():
+                deadline += frame_interval
                 try:
                     # 截取屏幕
                     screenshot = sct.grab(monitor)
@@ -117,12 +128,16 @@ class ScreenRecorder:
                     # 写入视频
                     self.writer.write(frame)
                     
-                    # 控制帧率
-                    time.sleep(1.0 / self.fps)
-                    
                 except Exception as e:
                     logger.error(f"录制错误: {e}")
-                    time.sleep(1.0 / self.fps)
+                
+                # 控制帧率（停止时立即唤醒）
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    stop_event.wait(remaining)
+                elif remaining < -frame_interval:
+                    # 落后超过一帧（长时间卡顿），重新对齐，避免连续补帧
+                    deadline = time.monotonic()
     
     def stop_recording(self) -> str:
         """停止录屏"""
@@ -130,6 +145,7 @@ class ScreenRecorder:
             return None
         
         self.recording = False
+        self._stop_event.set()
         
         if self.thread:
             self.thread.join(timeout=2)
@@ -138,7 +154,7 @@ class ScreenRecorder:
             self.writer.release()
             self.writer = None
         
-        logger.debug(f"屏幕录制结束: {self.output_file}")
+        logger.debug("屏幕录制结束: %s", self.output_file)
         return str(self.output_file)
 
 
@@ -165,7 +181,7 @@ def overlay_gaze_on_video(
         from pyedfread import read_edf
         
         # 读取 EDF 文件
-        logger.debug(f"读取 EDF: {edf_path}")
+        logger.debug("读取 EDF: %s", edf_path)
         # read_edf 返回三个 DataFrame: samples, events, messages
         samples, events, messages = read_edf(edf_path, ignore_samples=False)
         
@@ -186,7 +202,7 @@ def overlay_gaze_on_video(
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        logger.debug(f"视频: {width}x{height} @ {fps}fps, {total_frames} 帧")
+        logger.debug("视频: %sx%s @ %sfps, %s 帧", width, height, fps, total_frames)
         
         # 输出文件
         if not output_path:
@@ -229,13 +245,13 @@ def overlay_gaze_on_video(
                     msg_text = str(row[message_col])
                     if video_filename in msg_text or msg_text.endswith(video_filename):
                         screen_rec_start_time = row['time']
-                        logger.debug(f"找到屏幕录制开始标记: {msg_text} at {screen_rec_start_time} ms")
+                        logger.debug("找到屏幕录制开始标记: %s at %s ms", msg_text, screen_rec_start_time)
                         break
                 
                 # 如果没有匹配到，使用第一个
                 if screen_rec_start_time is None:
                     screen_rec_start_time = screen_rec_msgs.iloc[0]['time']
-                    logger.debug(f"使用第一个屏幕录制开始标记: {screen_rec_start_time} ms")
+                    logger.debug("使用第一个屏幕录制开始标记: %s ms", screen_rec_start_time)
 
             # 查找对应的结束标记
             if message_col:
@@ -248,12 +264,12 @@ def overlay_gaze_on_video(
                     msg_text = str(row[message_col])
                     if video_filename in msg_text or msg_text.endswith(video_filename):
                         screen_rec_end_time = row['time']
-                        logger.debug(f"找到屏幕录制结束标记: {msg_text} at {screen_rec_end_time} ms")
+                        logger.debug("找到屏幕录制结束标记: %s at %s ms", msg_text, screen_rec_end_time)
                         break
 
                 if screen_rec_end_time is None:
                     screen_rec_end_time = screen_rec_end_msgs.iloc[-1]['time']
-                    logger.debug(f"使用最后一个屏幕录制结束标记: {screen_rec_end_time} ms")
+                    logger.debug("使用最后一个屏幕录制结束标记: %s ms", screen_rec_end_time)
         
         # 确定视频开始对应的 EDF 时间戳
         if screen_rec_start_time is None:
@@ -265,10 +281,11 @@ def overlay_gaze_on_video(
 
         video_start_edf_time = screen_rec_start_time
         edf_duration = screen_rec_end_time - screen_rec_start_time
-        logger.debug(f"使用同步标记，EDF 起点: {video_start_edf_time} ms，持续: {edf_duration} ms")
+        logger.debug("使用同步标记，EDF 起点: %s ms，持续: %s ms", video_start_edf_time, edf_duration)
         
-        logger.debug(f"样本范围: {samples['time'].iloc[0]:.2f} - {samples['time'].iloc[-1]:.2f} ms, 共 {len(samples)} 条")
-        logger.debug(f"EDF samples 列名: {list(samples.columns)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("样本范围: %.2f - %.2f ms, 共 %d 条", samples['time'].iloc[0], samples['time'].iloc[-1], len(samples))
+            logger.debug("EDF samples 列名: %s", list(samples.columns))
 
         # 预处理事件（fixation / saccade）
         fixation_events = []
@@ -334,6 +351,7 @@ def overlay_gaze_on_video(
         saccade_idx = 0
         
         frame_idx = 0
+        progress_step = max(total_frames // 3, 1)  # 每 1/3 输出一次进度
         base_radius = 4
         max_radius = 16
         
@@ -377,10 +395,9 @@ def overlay_gaze_on_video(
             out.write(frame)
             frame_idx += 1
             
-            # 进度 (每 30% 输出一次)
-            progress = (frame_idx / total_frames) * 100
-            if frame_idx % (total_frames // 3) == 0:
-                logger.debug(f"Overlay 进度: {progress:.0f}%")
+            # 进度 (每 1/3 输出一次)
+            if frame_idx % progress_step == 0:
+                logger.debug("Overlay 进度: %.0f%%", frame_idx / total_frames * 100)
         
         # 释放资源
         cap.release()
@@ -393,12 +410,50 @@ def overlay_gaze_on_video(
         logger.error("pyedfread 未安装: pip install pyedfread")
         return False
     except Exception as e:
-        logger.error(f"Overlay 失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Overlay 失败: {e}", exc_info=True)
         return False
 
 
+# overlay 子进程最长运行时间，超时则终止，避免卡住后处理线程
+_OVERLAY_TIMEOUT = 1800  # 秒
+
+
+def overlay_gaze_on_video_isolated(video_path: str, edf_path: str, output_path: str = None) -> bool:
+    """
+    在独立子进程中执行 overlay_gaze_on_video
+    
+    子进程是直接运行本文件的全新解释器，不会重新导入 main.py；
+    逐帧处理视频不再与服务进程争用 GIL，OpenCV 崩溃也不会影响服务。
+    调用会阻塞到子进程结束，应在后台线程中调用。
+    """
+    # 路径转为绝对路径，子进程不依赖当前工作目录
+    cmd = [sys.executable, str(Path(__file__).resolve()),
+           str(Path(video_path).resolve()), str(Path(edf_path).resolve())]
+    if output_path:
+        cmd.append(str(Path(output_path).resolve()))
+    
+    # 子进程沿用当前日志级别（以数值传递，config 读取 LOG_LEVEL 环境变量）
+    env = dict(os.environ, LOG_LEVEL=str(logging.getLogger().getEffectiveLevel()))
+    try:
+        result = subprocess.run(cmd, env=env, timeout=_OVERLAY_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        logger.error("Overlay 子进程超时 (%s 秒)，已终止", _OVERLAY_TIMEOUT)
+        return False
+    
+    if result.returncode != 0:
+        logger.error("Overlay 子进程退出码: %s", result.returncode)
+    return result.returncode == 0
+
+
 # 全局录制器实例
 screen_recorder = ScreenRecorder()
 
+
+if __name__ == "__main__":
+    # overlay 子进程入口: python screen_recorder.py <video> <edf> [output]
+    import config
+    level = config.LOG_LEVEL
+    level = int(level) if level.isdigit() else getattr(logging, level.upper(), logging.INFO)
+    logging.basicConfig(level=level, format=config.LOG_FORMAT)
+    ok = overlay_gaze_on_video(*sys.argv[1:4])
+    sys.exit(0 if ok else 1)